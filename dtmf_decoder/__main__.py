@@ -12,14 +12,15 @@ Useful resources:
 
 import sys
 import math
-import time
+import queue
+import multiprocessing as mp
 import numpy as np
 import sounddevice as sd
-import matplotlib
-import matplotlib.pyplot as plt
 from dtmf_decoder.command_decoder import CommandDecoder
-from dtmf_decoder.helpers import clear_console, goertzel, \
-    find_closest_freq, get_frequency_energy_pairs
+from dtmf_decoder.plotting import plot_worker
+from dtmf_decoder.helpers import clear_console, goertzel_bins, SlidingGoertzel, \
+    build_closest_freq_table, lookup_closest_freq, get_frequency_energy_pairs, FrameRingBuffer, \
+    aligned_empty
 
 # We use 8 kHz as our sampling frequency as defined by the G.711 specification which is
 # used by most telephone systems. Human speech is contained in the 100 Hz-4 kHz range,
@@ -31,17 +32,35 @@ SAMPLE_WINDOW = 15 / 1000.0
 
 SAMPLE_SIZE = math.ceil(FS * SAMPLE_WINDOW)
 
-# Tone detection criteria
-MIN_TONE_ENERGY = 1
-MAX_TONE_DEVIATION = 50
+# How often to slide the sample window forward to detect signals again (in seconds),
+# consecutive windows overlap by SAMPLE_WINDOW - HOP_WINDOW
+HOP_WINDOW = 5 / 1000.0
+
+HOP_SIZE = math.ceil(FS * HOP_WINDOW)
+
+# How many hops the audio callback can get ahead of the decoder before frames are dropped
+RING_CAPACITY = 96
+
+# How many decoded signals can wait to be plotted before new ones are dropped
+PLOT_QUEUE_SIZE = 4
 
 # Minimum energy for the low and high frequencies of the DTMF signal to be considered as a keypress
 MIN_LOW_F_ENERGY = 5
 MIN_HIGH_F_ENERGY = 5
 
+# Tone detection criteria
+#
+# A window's Goertzel powers add up to at most SAMPLE_SIZE / 2 times its energy (sum of
+# squared samples), so windows below MIN_TONE_ENERGY can never reach both MIN_*_F_ENERGY.
+MIN_TONE_ENERGY = 2 * (MIN_LOW_F_ENERGY + MIN_HIGH_F_ENERGY) / SAMPLE_SIZE
+MAX_TONE_DEVIATION = 50
+
 # Minimum duration of a signal for it to be considered as a keypress (in seconds)
 MIN_SIGNAL_DURATION = 50 / 1000.0  # 50 ms
 
+# The same duration in hops, counted as a whole number so it doesn't pick up float rounding
+MIN_SIGNAL_HOPS = math.ceil(MIN_SIGNAL_DURATION / HOP_WINDOW)
+
 # Time to wait in-between consecutive signals (in seconds)
 SYMBOL_SPACING_DURATION = 100 / 1000.0  # 100 ms
 
@@ -74,6 +93,21 @@ KEYMAP = {
 LOW = [697, 770, 852, 941]
 HIGH = [1209, 1336, 1477, 1633]
 
+# The Goertzel bins covering the low and high DTMF frequencies only depend on FS and
+# SAMPLE_SIZE, so they are calculated once up front along with their frequencies.
+KS = goertzel_bins(FS, SAMPLE_SIZE, (LOW[0], LOW[-1]), (HIGH[0], HIGH[-1]))
+FREQS = KS * FS / SAMPLE_SIZE
+
+# These tables are shared by every window and never change
+KS.setflags(write=False)
+FREQS.setflags(write=False)
+
+# Maps whole frequencies to the closest low or high DTMF frequency (within MAX_TONE_DEVIATION)
+LOW_TABLE = build_closest_freq_table(LOW, deviation=MAX_TONE_DEVIATION)
+HIGH_TABLE = build_closest_freq_table(HIGH, deviation=MAX_TONE_DEVIATION)
+LOW_TABLE.setflags(write=False)
+HIGH_TABLE.setflags(write=False)
+
 BANNER = r'''
                     _
                     | |
@@ -111,129 +145,113 @@ BANNER = r'''
 '''
 
 
-def plot_signal(signal):
-    frames = signal['frames']
-    freqs = signal['freqs']
-    results = signal['results']
-    pressed_key = signal['pressed_key']
-
-    f_low = signal['f_low']
-    closest_low = signal['closest_low']
-    energy_low = signal['energy_low']
-
-    f_high = signal['f_high']
-    closest_high = signal['closest_high']
-    energy_high = signal['energy_high']
+def decoded_signals():
+    ring = FrameRingBuffer(RING_CAPACITY, HOP_SIZE)
 
-    # Plot the input signal
-    plt.subplot(2, 1, 1)
-    plt.cla()
-    t = np.linspace(0, 1, FS)[:SAMPLE_SIZE]
+    # Latest problem flagged by the audio stream, reported by the decoder loop
+    input_status = None
 
-    plt.title('Input Signal')
-    plt.plot(t, frames)
+    def on_frames(indata, frames, time_info, status):
+        nonlocal input_status
 
-    plt.xlabel('Time (s)')
-    plt.ylabel('Amplitude')
+        # Runs on the audio thread, `indata` is a 2D numpy array as
+        # (frames, channels) containing a column for every channel.
+        if status:
+            input_status = status
 
-    # Plot the goertzel result on the input signal
-    plt.subplot(2, 1, 2)
-    plt.cla()
-    plt.yscale('log')
+        ring.push(indata[:, 0])
 
-    plt.title(
-        f'Goertzel Filtered Signal (Key: {pressed_key})\n' \
-            f'f_low={f_low:.1f} Hz, e_low={energy_low:.1f} / ' \
-                f'f_high={f_high:.1f} Hz, e_high={energy_high:.1f}')
+    stream = sd.InputStream(
+        samplerate=FS, channels=1, dtype='float32',
+        blocksize=HOP_SIZE, callback=on_frames)
+    stream.start()
 
-    plt.stem(freqs, np.array(results)[:,2], linefmt=':')
+    # Reused for every hop so that reading from the ring buffer doesn't allocate
+    hop_np = np.empty(HOP_SIZE, dtype=np.float32)
 
-    plt.gca().annotate(
-        f'{f_low:.1f} (@{closest_low} Hz)',
-        xy=(f_low, energy_low),
-        xytext=(f_low + 50, energy_low),
-        color='purple',
-        arrowprops={'arrowstyle': '<-'}
-    )
+    sliding_goertzel = SlidingGoertzel(KS, SAMPLE_SIZE)
 
-    plt.gca().annotate(
-        f'{f_high:.1f} (@{closest_high} Hz)',
-        xy=(f_high, energy_high),
-        xytext=(f_high + 50, energy_high),
-        color='purple',
-        arrowprops={'arrowstyle': '<-'}
-    )
+    # Reused for every hop so that reading out the power of the bins doesn't allocate
+    power = aligned_empty(len(KS), np.float64)
 
-    plt.xlabel('Frequency (Hz)')
-    plt.ylabel('Energy')
+    # Local aliases, saving a global lookup on every hop
+    min_tone_energy = MIN_TONE_ENERGY
+    min_low_energy = MIN_LOW_F_ENERGY
+    min_high_energy = MIN_HIGH_F_ENERGY
 
-    plt.ylim([1, 30000])
+    current_signal_hops = 0
 
-    plt.subplots_adjust(hspace=0.8)
+    # Time is counted in hops of audio rather than by the clock, so that working
+    # through hops that piled up in the ring buffer doesn't squeeze the keys together
+    hop = 0
+    last_key_hop = 0
 
-    # Save the plot
-    # plt.savefig('dtmf-plot.png')
+    reported_dropped = 0
 
-    plt.pause(0.5)
+    while True:
 
+        ring.pop_into(hop_np)
+        hop += 1
 
-def decoded_signals():
-    stream = sd.Stream(samplerate=FS, channels=1)
-    stream.start()
+        # Report input problems here rather than from the audio thread
+        if input_status:
+            print(f'\nWarning: audio input {input_status}', file=sys.stderr)
+            input_status = None
 
-    current_signal_time = 0
-    current_time = time.time()
+        if ring.dropped != reported_dropped:
+            print(f'\nWarning: decoder fell behind, dropped {ring.dropped - reported_dropped} hops of audio', file=sys.stderr)
+            reported_dropped = ring.dropped
 
-    while True:
+        # Slide the window forward by one hop
+        sliding_goertzel.push(hop_np)
 
-        # Returns a 2D numpy array as (frames, channels) containing
-        # a column for every channel.
-        frames, _ = stream.read(SAMPLE_SIZE)
-        frames_np = np.array(frames)[:,0]
+        # Most windows are silence, skip them before reading out the power of the bins
+        if sliding_goertzel.energy() < min_tone_energy:
+            current_signal_hops = 0
+            continue
 
-        freqs, results = goertzel(frames_np, FS, (697, 941), (1209, 1633))
+        sliding_goertzel.power(out=power)
 
-        pair_low, pair_high = get_frequency_energy_pairs(freqs, results)
+        pair_low, pair_high = get_frequency_energy_pairs(FREQS, power)
 
         f_low, energy_low = pair_low
         f_high, energy_high = pair_high
 
-        closest_low = find_closest_freq(f_low, LOW, deviation=MAX_TONE_DEVIATION)
-        closest_high = find_closest_freq(f_high, HIGH, deviation=MAX_TONE_DEVIATION)
-
-        reached_energy_threshold = energy_low > MIN_LOW_F_ENERGY and energy_high > MIN_HIGH_F_ENERGY
-        reached_signal_duration_threshold = current_signal_time >= MIN_SIGNAL_DURATION
-        found_freq_pair = closest_low and closest_high
-
-        if reached_energy_threshold and reached_signal_duration_threshold and found_freq_pair:
-            pressed_key = KEYMAP[(closest_low, closest_high)]
-
-            keypress_time = time.time()
-            current_spaced_time = keypress_time - current_time
-
-            if current_spaced_time >= SYMBOL_SPACING_DURATION:
-                current_time = time.time()
-
-                yield {
-                    'pressed_key': pressed_key,
-                    'f_low': f_low,
-                    'closest_low': closest_low,
-                    'energy_low': energy_low,
-                    'f_high': f_high,
-                    'closest_high': closest_high,
-                    'energy_high': energy_high,
-                    'frames': frames_np,
-                    'freqs': freqs,
-                    'results': results
-                }
-
-        if not reached_signal_duration_threshold and found_freq_pair:
-            current_signal_time += SAMPLE_WINDOW
-        else:
-            current_signal_time = 0
+        # Check the energy before looking up the frequencies
+        if energy_low <= min_low_energy or energy_high <= min_high_energy:
+            current_signal_hops = 0
+            continue
+
+        closest_low = lookup_closest_freq(f_low, LOW_TABLE)
+        closest_high = lookup_closest_freq(f_high, HIGH_TABLE)
+
+        if not (closest_low and closest_high):
+            current_signal_hops = 0
+            continue
+
+        if current_signal_hops < MIN_SIGNAL_HOPS:
+            current_signal_hops += 1
+            continue
+
+        current_signal_hops = 0
 
-        # Play the input signal through speakers
-        # stream.write(frames)
+        current_spaced_time = (hop - last_key_hop) * HOP_WINDOW
+
+        if current_spaced_time >= SYMBOL_SPACING_DURATION:
+            last_key_hop = hop
+
+            yield {
+                'pressed_key': KEYMAP[(closest_low, closest_high)],
+                'f_low': f_low,
+                'closest_low': closest_low,
+                'energy_low': energy_low,
+                'f_high': f_high,
+                'closest_high': closest_high,
+                'energy_high': energy_high,
+                'frames': sliding_goertzel.window(),
+                'freqs': FREQS,
+                'power': power.copy()
+            }
 
 
 if __name__ == '__main__':
@@ -248,24 +266,9 @@ if __name__ == '__main__':
     if command == 'live-plot':
         live_plot = True
 
-        matplotlib.use('TkAgg')
-
-        plt.figure(figsize=(10, 6))
-
-        # Get the current screen dimensions
-        screen_width = plt.get_current_fig_manager().window.winfo_screenwidth()
-        screen_height = plt.get_current_fig_manager().window.winfo_screenheight()
-
-        # matplotlib window size
-        window_width = 1000
-        window_height = 600
-
-        # Set the matplotlib window size and center it on screen
-        plt.get_current_fig_manager().window.geometry(f'{window_width}x{window_height}')
-        plt.get_current_fig_manager().window.wm_geometry(f'+{(screen_width - window_width) // 2}+{(screen_height - window_height) // 2}')
-
-        # Set the window title
-        plt.get_current_fig_manager().set_window_title('Dual-tone multi-frequency (DTMF) Decoder')
+        plot_queue = mp.Queue(maxsize=PLOT_QUEUE_SIZE)
+        plot_process = mp.Process(target=plot_worker, args=(plot_queue, FS, SAMPLE_SIZE), daemon=True)
+        plot_process.start()
 
     elif command == 'command-decoder':
         enable_command_decoder = True
@@ -285,5 +288,13 @@ if __name__ == '__main__':
             print('', end='', flush=True)
             print(signal['pressed_key'], end='', flush=True)
 
+        if live_plot and not plot_process.is_alive():
+            print('\nWarning: the plot window exited, live plotting stopped', file=sys.stderr)
+            live_plot = False
+
         if live_plot:
-            plot_signal(signal)
+            try:
+                plot_queue.put_nowait(signal)
+            except queue.Full:
+                # The plot is lagging behind, skip this signal rather than wait for it
+                pass
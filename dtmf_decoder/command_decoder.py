@@ -5,6 +5,7 @@ A demo that executes commands based on the detected DTMF signals.
 """
 
 import requests
+import requests.adapters
 import colorama
 from dtmf_decoder.helpers import clear_console
 
@@ -42,10 +43,14 @@ class CommandDecoder:
             '2222': self.get_random_activity
         }
 
+        # Reuse connections to the APIs across commands
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
         self.show_screen()
 
     def make_api_call(self, api):
-        r = requests.get(api)
+        r = self.session.get(api, timeout=5)
         return r.json()
 
     def get_random_activity(self):
@@ -1,7 +1,101 @@
-import os
-import platform
-import math
+import sys
+import threading
 import numpy as np
+from numba import njit
+
+# ANSI escape sequence to clear the screen and move the cursor to the top left
+CLEAR_SCREEN = '\x1b[2J\x1b[H'
+
+
+@njit(cache=True, fastmath=True)
+def _goertzel_power_kernel(w_real, d1, d2, out):
+
+    """
+    Writes the power of every bin, given its Goertzel state, into `out`.
+    """
+
+    for i in range(w_real.shape[0]):
+        out[i] = d2[i] * d2[i] + d1[i] * d1[i] - w_real[i] * d1[i] * d2[i]
+
+
+@njit('void(f4[:], f4[:], f4[:])', cache=True, fastmath=True)
+def _goertzel_kernel(samples, w_real, out):
+
+    """
+    Runs the Goertzel recurrence over `samples` for all bins at once.
+
+    The state of every bin is kept in the `d1` and `d2` vectors (one entry
+    per coefficient in `w_real`), so each sample updates all bins in a
+    single pass. The power of each bin is written into `out`.
+
+    Everything is computed in float32, which is plenty for the short DTMF
+    windows and lets `x + w_real * d1 - d2` compile to packed FMA instructions.
+    """
+
+    d1 = np.zeros_like(w_real)
+    d2 = np.zeros_like(w_real)
+
+    for n in range(samples.shape[0]):
+        x = samples[n]
+        for i in range(w_real.shape[0]):
+            y = x + w_real[i] * d1[i] - d2[i]
+            d2[i] = d1[i]
+            d1[i] = y
+
+    _goertzel_power_kernel(w_real, d1, d2, out)
+
+
+@njit(cache=True, fastmath=True)
+def _sliding_goertzel_kernel(samples, history, pos, w_real, d1, d2):
+
+    """
+    Pushes `samples` through the sliding Goertzel recurrence of every bin.
+
+    Each sample is combed with the sample leaving the window (kept in the
+    `history` ring at `pos`) before being fed to the bins, updating the
+    `d1` and `d2` state in place. Returns the new position in `history`.
+    """
+
+    window_size = history.shape[0]
+
+    for n in range(samples.shape[0]):
+        x = samples[n]
+        comb = x - history[pos]
+
+        history[pos] = x
+        pos += 1
+        if pos == window_size:
+            pos = 0
+
+        for i in range(w_real.shape[0]):
+            y = comb + w_real[i] * d1[i] - d2[i]
+            d2[i] = d1[i]
+            d1[i] = y
+
+    return pos
+
+
+def goertzel_bins(sample_rate, window_size, *freqs):
+
+    """
+    Calculates all the DFT bins that have to be computed to include
+    the frequency ranges in `freqs` for a window of `window_size` samples.
+    """
+
+    bins = []
+    for f_range in freqs:
+        f_start, f_end = f_range
+
+        # floor(f_start / f_step) and ceil(f_end / f_step) in integer arithmetic,
+        # with f_step being sample_rate / window_size
+        k_start = int(f_start * window_size // sample_rate)
+        k_end = int(-(-f_end * window_size // sample_rate))
+
+        if k_end > window_size - 1: raise ValueError('frequency out of range %s' % k_end)
+        bins.append(np.arange(k_start, k_end))
+
+    # Sorted, without the bins shared by overlapping ranges
+    return np.unique(np.concatenate(bins))
 
 
 def goertzel(samples, sample_rate, *freqs):
@@ -13,55 +107,49 @@ def goertzel(samples, sample_rate, *freqs):
     `samples` is a windowed one-dimensional signal originally sampled at `sample_rate`.
 
     The function returns 2 arrays, one containing the actual frequencies calculated,
-    the second the coefficients `(real part, imag part, power)` for each of those frequencies.
-    For simple spectral analysis, the power is usually enough.
+    the second the power for each of those frequencies.
 
     Example of usage :
         
-        freqs, results = goertzel(some_samples, 44100, (400, 500), (1000, 1100))
+        freqs, power = goertzel(some_samples, 44100, (400, 500), (1000, 1100))
     """
 
     window_size = len(samples)
-    f_step = sample_rate / float(window_size)
-    f_step_normalized = 1.0 / window_size
+    ks = goertzel_bins(sample_rate, window_size, *freqs)
 
-    # Calculate all the DFT bins we have to compute to include frequencies
-    # in `freqs`.
-    bins = set()
-    for f_range in freqs:
-        f_start, f_end = f_range
-        k_start = int(math.floor(f_start / f_step))
-        k_end = int(math.ceil(f_end / f_step))
+    # Coefficients for all the bins, calculated in one go
+    w_real = (2.0 * np.cos(2.0 * np.pi * ks / window_size)).astype(np.float32)
+
+    return goertzel_fixed(samples, w_real, ks * sample_rate / window_size)
 
-        if k_end > window_size - 1: raise ValueError('frequency out of range %s' % k_end)
-        bins = bins.union(range(k_start, k_end))
 
-    # For all the bins, calculate the DFT term
-    n_range = range(0, window_size)
-    freqs = []
-    results = []
-    for k in bins:
+def goertzel_fixed(samples, w_real, freqs, out=None):
 
-        # Bin frequency and coefficients for the computation
-        f = k * f_step_normalized
-        w_real = 2.0 * math.cos(2.0 * math.pi * f)
-        w_imag = math.sin(2.0 * math.pi * f)
+    """
+    Same as `goertzel`, but for a fixed set of bins whose coefficients `w_real`
+    and frequencies `freqs` were calculated up front (e.g. with `goertzel_bins`).
 
-        # Doing the calculation on the whole sample
-        d1, d2 = 0.0, 0.0
-        for n in n_range:
-            y  = samples[n] + w_real * d1 - d2
-            d2, d1 = d1, y
+    Useful when the sample rate and window size never change, as it skips
+    working out the bins and their coefficients for every window. The power
+    is written into `out` when given, so the same buffer can be reused.
 
-        # Storing results `(real part, imag part, power)`
-        results.append((
-            0.5 * w_real * d1 - d2, w_imag * d1,
-            d2**2 + d1**2 - w_real * d1 * d2)
-        )
+    The kernel runs in float32: `samples` and `w_real` are converted if needed,
+    `out` has to be a float32 array.
+    """
 
-        freqs.append(f * sample_rate)
+    w_real = np.asarray(w_real, dtype=np.float32)
 
-    return freqs, results
+    if out is None:
+        out = np.empty_like(w_real)
+    elif out.dtype != np.float32:
+        raise TypeError('out must be a float32 array, got %s' % out.dtype)
+    elif out.shape != w_real.shape:
+        raise ValueError('out must have shape %s, got %s' % (w_real.shape, out.shape))
+
+    samples = np.asarray(samples, dtype=np.float32)
+    _goertzel_kernel(samples, w_real, out)
+
+    return freqs, out
 
 
 def find_closest_freq(n, freqs, deviation=0):
@@ -81,51 +169,204 @@ def find_closest_freq(n, freqs, deviation=0):
         return None
 
 
-def get_frequency_energy_pairs(freqs, results):
+class SlidingGoertzel:
+
+    """
+    Sliding version of `goertzel_fixed` for the DFT bins in `ks`.
+
+    The recurrence state of every bin is kept across calls to `push` and the
+    contribution of samples older than `window_size` is subtracted as new ones
+    arrive, so the power over the last `window_size` samples can be read after
+    every pushed block at a cost of O(1) per sample, instead of running the
+    whole window through the recurrence again.
+
+    The resonators sit right on the unit circle, so the state and coefficients
+    are kept in float64 to stop rounding errors from building up over time.
+    """
+
+    def __init__(self, ks, window_size):
+        self.window_size = window_size
+
+        # The coefficients and state are read for every sample, keep them
+        # aligned so that SIMD loads don't straddle cache lines.
+        self.w_real = aligned_empty(len(ks), np.float64)
+        self.w_real[:] = 2.0 * np.cos(2.0 * np.pi * np.asarray(ks) / window_size)
+        self.w_real.setflags(write=False)
+
+        self.d1 = aligned_empty(len(ks), np.float64)
+        self.d2 = aligned_empty(len(ks), np.float64)
+        self.d1[:] = 0.0
+        self.d2[:] = 0.0
+
+        # The last `window_size` samples, `pos` being the oldest
+        self.history = np.zeros(window_size)
+        self.pos = 0
+
+    def push(self, samples):
+        self.pos = _sliding_goertzel_kernel(
+            samples, self.history, self.pos, self.w_real, self.d1, self.d2)
+
+    def power(self, out=None):
+        # Written into `out` when given, so the same buffer can be reused
+        if out is None:
+            out = np.empty_like(self.w_real)
+        elif out.shape != self.w_real.shape:
+            raise ValueError('out must have shape %s, got %s' % (self.w_real.shape, out.shape))
+
+        _goertzel_power_kernel(self.w_real, self.d1, self.d2, out)
+
+        return out
+
+    def energy(self):
+        # Sum of the squared samples currently in the window
+        return self.history @ self.history
+
+    def window(self):
+        # The samples currently in the window, oldest first
+        return np.roll(self.history, -self.pos)
+
+
+def aligned_empty(size, dtype, alignment=32):
+
+    """
+    Returns a new one-dimensional array of <size> items, without initializing
+    its entries, whose data starts on an <alignment> byte boundary.
+    """
+
+    dtype = np.dtype(dtype)
+    nbytes = size * dtype.itemsize
+
+    raw = np.empty(nbytes + alignment, dtype=np.uint8)
+    offset = -raw.ctypes.data % alignment
+
+    return raw[offset:offset + nbytes].view(dtype)
+
+
+# Compile the sliding kernels at import, with the same argument types the decoder
+# uses, so the first decoded hop doesn't pay for it
+_warm_up = SlidingGoertzel(np.arange(1), 2)
+_warm_up.push(np.zeros(1, dtype=np.float32))
+_warm_up.power(out=aligned_empty(1, np.float64))
+del _warm_up
+
+
+def build_closest_freq_table(freqs, deviation=0):
+
+    """
+    Builds a lookup table mapping every whole frequency (in Hz) to the
+    closest frequency in <freqs> within <deviation>, or -1 if there is none.
+
+    See `find_closest_freq` and `lookup_closest_freq`.
+    """
+
+    table = np.full(max(freqs) + deviation + 1, -1, dtype=np.int16)
+
+    for n in range(len(table)):
+        closest = find_closest_freq(n, freqs, deviation=deviation)
+
+        if closest is not None:
+            table[n] = closest
+
+    return table
+
+
+def lookup_closest_freq(n, table):
+
+    """
+    Looks up the closest frequency to <n> in a table from `build_closest_freq_table`.
+
+    <n> is rounded to the nearest whole frequency first, so unlike `find_closest_freq`
+    it also accepts frequencies up to 0.5 Hz beyond the deviation (e.g. 646.6 Hz
+    maps to 697 Hz with a deviation of 50 Hz).
+    """
+
+    i = int(round(n))
+
+    if 0 <= i < len(table):
+        closest = table[i]
+
+        if closest >= 0:
+            return int(closest)
+
+    return None
+
+
+def get_frequency_energy_pairs(freqs, power):
 
     """
     Get the two frequencies with the highest energy from
-    goertzel filtered results. This can then be used to determine
+    goertzel filtered power. This can then be used to determine
     the DTMF signal based on the lower and higher frequencies.
 
     More info:
      - https://en.wikipedia.org/wiki/Dual-tone_multi-frequency_signaling#Keypad
     """
 
-    np_results = np.array(results)[:,2]
-    np_freqs = np.array(freqs)
+    # Indices of the two highest energy levels, in no particular order
+    i, j = np.argpartition(power, -2)[-2:]
 
-    # Sort from lowest->highest frequency energy
-    sorted_energies = np_results.argsort()
+    # Order them by frequency instead, lower frequency first
+    if freqs[i] > freqs[j]:
+        i, j = j, i
 
-    # Get the two highest energy levels along with their associated frequency
-    f1_energy = np_results[sorted_energies[-2]]
-    f2_energy = np_results[sorted_energies[-1]]
+    low = [freqs[i], power[i]]
+    high = [freqs[j], power[j]]
 
-    # Get the associated frequencies
-    f1_idx = np.where(np_results == f1_energy)
-    f2_idx = np.where(np_results == f2_energy)
+    return low, high
 
-    f1 = np_freqs[f1_idx][0]
-    f2 = np_freqs[f2_idx][0]
 
-    if f1 < f2:
-        low = [f1, f1_energy]
-        high = [f2, f2_energy]
-    else:
-        low = [f2, f2_energy]
-        high = [f1, f1_energy]
+class FrameRingBuffer:
 
-    return low, high
+    """
+    Single-producer/single-consumer ring buffer of fixed size audio frames.
+
+    All the slots are allocated up front so that pushing a frame from the
+    audio callback never allocates. When the consumer falls behind and the
+    buffer is full, incoming frames are dropped (and counted in `dropped`).
+    """
+
+    def __init__(self, capacity, frame_size, dtype=np.float32):
+        self.capacity = capacity
+        self.frames = np.empty((capacity, frame_size), dtype=dtype)
+
+        # Monotonic counters, `head` is only written by the producer
+        # and `tail` only by the consumer.
+        self.head = 0
+        self.tail = 0
+
+        self.dropped = 0
+        self.available = threading.Semaphore(0)
+
+    def push(self, frame):
+        head = self.head
+
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+
+        self.frames[head % self.capacity] = frame
+        self.head = head + 1
+        self.available.release()
+
+        return True
+
+    def pop_into(self, out):
+        # Blocks until the producer has pushed a frame
+        self.available.acquire()
+
+        tail = self.tail
+        out[:] = self.frames[tail % self.capacity]
+        self.tail = tail + 1
+
+        return out
 
 
 def clear_console():
 
     """
-    Clears the console based on the platform
+    Clears the console using ANSI escape sequences, which colorama
+    translates for Windows consoles once `colorama.init()` was called.
     """
 
-    if platform.system() == 'Windows':
-        os.system('cls')
-    else:
-        os.system('clear')
+    sys.stdout.write(CLEAR_SCREEN)
+    sys.stdout.flush()
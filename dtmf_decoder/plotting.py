@@ -0,0 +1,111 @@
+"""
+
+Live plotting of the decoded DTMF signals.
+
+Kept out of `__main__` so that the plotting process can import it, which
+multiprocessing needs when it spawns processes instead of forking them.
+
+"""
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+
+
+def plot_signal(signal, t_axis):
+    frames = signal['frames']
+    freqs = signal['freqs']
+    power = signal['power']
+    pressed_key = signal['pressed_key']
+
+    f_low = signal['f_low']
+    closest_low = signal['closest_low']
+    energy_low = signal['energy_low']
+
+    f_high = signal['f_high']
+    closest_high = signal['closest_high']
+    energy_high = signal['energy_high']
+
+    # Plot the input signal
+    plt.subplot(2, 1, 1)
+    plt.cla()
+    plt.title('Input Signal')
+    plt.plot(t_axis, frames)
+
+    plt.xlabel('Time (s)')
+    plt.ylabel('Amplitude')
+
+    # Plot the goertzel result on the input signal
+    plt.subplot(2, 1, 2)
+    plt.cla()
+    plt.yscale('log')
+
+    plt.title(
+        f'Goertzel Filtered Signal (Key: {pressed_key})\n' \
+            f'f_low={f_low:.1f} Hz, e_low={energy_low:.1f} / ' \
+                f'f_high={f_high:.1f} Hz, e_high={energy_high:.1f}')
+
+    plt.stem(freqs, power, linefmt=':')
+
+    plt.gca().annotate(
+        f'{f_low:.1f} (@{closest_low} Hz)',
+        xy=(f_low, energy_low),
+        xytext=(f_low + 50, energy_low),
+        color='purple',
+        arrowprops={'arrowstyle': '<-'}
+    )
+
+    plt.gca().annotate(
+        f'{f_high:.1f} (@{closest_high} Hz)',
+        xy=(f_high, energy_high),
+        xytext=(f_high + 50, energy_high),
+        color='purple',
+        arrowprops={'arrowstyle': '<-'}
+    )
+
+    plt.xlabel('Frequency (Hz)')
+    plt.ylabel('Energy')
+
+    plt.ylim([1, 30000])
+
+    plt.subplots_adjust(hspace=0.8)
+
+    # Save the plot
+    # plt.savefig('dtmf-plot.png')
+
+    plt.pause(0.5)
+
+
+def plot_worker(signals, sample_rate, window_size):
+
+    """
+    Plots the signals from the <signals> queue as they come in. Runs in its own
+    process so that rendering the plots never holds up decoding.
+
+    <sample_rate> and <window_size> describe the sample windows being plotted.
+    """
+
+    # Time axis of a sample window, used when plotting the input signal
+    t_axis = np.arange(window_size, dtype=np.float32) / sample_rate
+
+    matplotlib.use('TkAgg')
+
+    plt.figure(figsize=(10, 6))
+
+    # Get the current screen dimensions
+    screen_width = plt.get_current_fig_manager().window.winfo_screenwidth()
+    screen_height = plt.get_current_fig_manager().window.winfo_screenheight()
+
+    # matplotlib window size
+    window_width = 1000
+    window_height = 600
+
+    # Set the matplotlib window size and center it on screen
+    plt.get_current_fig_manager().window.geometry(f'{window_width}x{window_height}')
+    plt.get_current_fig_manager().window.wm_geometry(f'+{(screen_width - window_width) // 2}+{(screen_height - window_height) // 2}')
+
+    # Set the window title
+    plt.get_current_fig_manager().set_window_title('Dual-tone multi-frequency (DTMF) Decoder')
+
+    while True:
+        plot_signal(signals.get(), t_axis)